@@ -1,88 +1,248 @@
+import json
+import logging
+import time
 import requests
-from typing import Optional, Dict, List, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Any, Tuple
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder/decoder
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:  # msgpack is only negotiated when the decoder is present
+    ormsgpack = None
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+
+def _loads(content: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _decode(content: bytes, content_type: str) -> Any:
+    """Decode a response body according to its Content-Type."""
+    if ormsgpack is not None and 'msgpack' in content_type:
+        return ormsgpack.unpackb(content)
+    return _loads(content)
+
+
+_LIST_KEYS = ('records', 'items', 'results', 'result')
+
+
+def _as_records(data: Any) -> Any:
+    """Normalize a list endpoint body to a list of records.
+    Bare lists keep only dict entries (sometimes APIs include strings); wrapper
+    objects are unwrapped via the first list-valued key in _LIST_KEYS, and any
+    other dict is treated as a single record.
+    """
+    if type(data) is list:
+        return [d for d in data if isinstance(d, dict)]
+    if isinstance(data, dict):
+        for k in _LIST_KEYS:
+            v = data.get(k)
+            if isinstance(v, list):
+                return v
+        return [data]
+    return data
+
+
+class IndexerTestError(RuntimeError):
+    """An indexer test answered with an HTTP error; status_code lets callers tell a
+    rejected test (4xx) from a transient server problem (429/5xx). It is None when a
+    remembered failure that wasn't an HTTP error is raised again.
+    """
+    def __init__(self, message: str, status_code: Optional[int]):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class ProwlarrClient:
-    def __init__(self, base_url: str, api_key: str, timeout: int = 30):
+    def __init__(self, base_url: str, api_key: str, timeout: int = 30, cache_ttl: float = 30,
+                 pool_maxsize: int = 32, max_retries: int = 5):
         self.base_url = base_url.rstrip('/')
         self.api_key = api_key
+        # endpoint URLs are fixed per client; build them once instead of per call
+        self._api = self.base_url + '/api/v1/'
+        self._u_indexer = self._api + 'indexer'
+        self._u_indexer_status = self._api + 'indexerstatus'
+        self._u_test = self._api + 'indexer/test'
+        self._u_tag = self._api + 'tag'
+        self._u_indexer_fmt = self._u_indexer + '/%s'
         self.session = requests.Session()
-        self.session.headers.update({"X-Api-Key": self.api_key, "Content-Type": "application/json"})
+        self.session.headers.update({
+            "X-Api-Key": self.api_key,
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        })
+        # advertise every encoding urllib3 can decode here (br with brotli installed, zstd
+        # with urllib3's zstd extra) so servers never send a body we can't decompress
+        self.session.headers.update(make_headers(accept_encoding=True))
+        if ormsgpack is not None:
+            # servers (or transcoding proxies) that can't do msgpack just answer with JSON
+            self.session.headers['Accept'] = 'application/msgpack, application/json;q=0.9'
+        # Larger pool so concurrent calls don't queue for a socket, and retry transient
+        # gateway errors on GET/PUT with exponential backoff instead of failing the cycle.
+        # POST is left alone: tag creation isn't idempotent, and callers retry indexer
+        # tests themselves, so transport retries there would only multiply attempts
+        retry = Retry(total=max_retries, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset(['GET', 'PUT']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.timeout = timeout
+        # tag list cache, indexed by label; refreshed once older than cache_ttl seconds
+        self.cache_ttl = cache_ttl
+        self._tag_cache: Optional[List[Dict[str, Any]]] = None
+        self._tag_cache_ts = 0.0
+        self._tag_by_label: Dict[str, Dict[str, Any]] = {}
+        # conditional GET state: validator headers and (raw body, content type) of the last 200
+        self._validators: Dict[str, Dict[str, str]] = {}
+        self._bodies: Dict[str, Tuple[bytes, str]] = {}
+        # get_indexer results by id as (fetched_at, raw body, content type); update_indexer
+        # refreshes the entry with the server's response
+        self._indexer_cache: Dict[Any, Tuple[float, bytes, str]] = {}
 
-    def _url(self, path: str) -> str:
-        return f"{self.base_url}/api/v1/{path.lstrip('/')}"
+    def close(self) -> None:
+        self.session.close()
 
-    def get_indexers(self) -> List[Dict[str, Any]]:
-        r = self.session.get(self._url('indexer'))
+    def __enter__(self) -> 'ProwlarrClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _cached_get(self, url: str) -> Any:
+        """GET url, revalidating with If-None-Match / If-Modified-Since when the
+        previous response carried an ETag or Last-Modified. On 304 the cached body
+        is decoded again; raw bytes are kept rather than the parsed object so
+        callers are free to mutate what they get back.
+        """
+        r = self.session.get(url, headers=self._validators.get(url), timeout=self.timeout)
+        if r.status_code == 304 and url in self._bodies:
+            return _decode(*self._bodies[url])
         r.raise_for_status()
-        data = r.json()
-        # sometimes the API returns a wrapper object
-        if isinstance(data, dict):
-            for key in ('records', 'items', 'results'):
-                if key in data and isinstance(data[key], list):
-                    return data[key]
-            # if dict but looks like an indexer list, try to return list of values
-            if isinstance(data.get('result'), list):
-                return data.get('result')
-            if isinstance(data.get('items'), list):
-                return data.get('items')
-            # maybe data is a single indexer
-            return [data]
-        if isinstance(data, list):
-            # return only dict entries (sometimes APIs include strings)
-            return [d for d in data if isinstance(d, dict)]
-        return data
+        content_type = r.headers.get('Content-Type', '')
+        validators = {}
+        if r.headers.get('ETag'):
+            validators['If-None-Match'] = r.headers['ETag']
+        if r.headers.get('Last-Modified'):
+            validators['If-Modified-Since'] = r.headers['Last-Modified']
+        if validators:
+            self._validators[url] = validators
+            self._bodies[url] = (r.content, content_type)
+        else:
+            self._validators.pop(url, None)
+            self._bodies.pop(url, None)
+        return _decode(r.content, content_type)
+
+    def get_indexers(self) -> List[Dict[str, Any]]:
+        return _as_records(self._cached_get(self._u_indexer))
 
     def get_indexer_statuses(self) -> List[Dict[str, Any]]:
-        r = self.session.get(self._url('indexerstatus'))
-        r.raise_for_status()
-        data = r.json()
-        if isinstance(data, list):
-            return [d for d in data if isinstance(d, dict)]
-        return data
+        return _as_records(self._cached_get(self._u_indexer_status))
+
+    def bootstrap(self, include_tags: bool = True) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """Fetch indexers, indexer statuses and (optionally) tags concurrently so a
+        run cycle starts after one round-trip instead of three. Fetching the tags
+        here also primes the tag cache used by find_or_create_tag. The tags are only a
+        prefetch: if fetching them fails, None is returned in their place and
+        find_or_create_tag fetches them again when an indexer needs the tag.
+        """
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            fi = ex.submit(self.get_indexers)
+            fs = ex.submit(self.get_indexer_statuses)
+            ft = ex.submit(self.get_tags) if include_tags else None
+            indexers, statuses = fi.result(), fs.result()
+            tags = None
+            if ft is not None:
+                try:
+                    tags = ft.result()
+                except Exception as e:
+                    logger.warning(f"Failed to prefetch tags; they will be fetched when needed: {e}")
+            return indexers, statuses, tags
 
     def get_indexer(self, idx_id: int) -> Dict[str, Any]:
-        r = self.session.get(self._url(f'indexer/{idx_id}'))
+        hit = self._indexer_cache.get(idx_id)
+        if hit is not None and time.monotonic() - hit[0] < self.cache_ttl:
+            return _decode(hit[1], hit[2])
+        r = self.session.get(self._u_indexer_fmt % idx_id, timeout=self.timeout)
         r.raise_for_status()
-        return r.json()
+        content_type = r.headers.get('Content-Type', '')
+        self._indexer_cache[idx_id] = (time.monotonic(), r.content, content_type)
+        return _decode(r.content, content_type)
 
     def test_indexer(self, indexer_obj: Dict[str, Any]) -> Dict[str, Any]:
-        r = self.session.post(self._url('indexer/test'), json=indexer_obj, timeout=self.timeout)
+        r = self.session.post(self._u_test, data=_dumps(indexer_obj), timeout=self.timeout)
         # Server returns JSON describing result in many cases; include body for debugging on errors
         try:
             r.raise_for_status()
         except Exception as e:
-            # include response text up to safe size for debugging
-            text = None
+            # include response text up to a safe size for debugging; decoding a 2KB
+            # slice directly skips requests' charset detection over the whole body
             try:
-                text = r.text
+                text = r.content[:2048].decode('utf-8', 'replace') if r.content else '<empty>'
             except Exception:
                 text = '<unavailable>'
-            raise RuntimeError(f"Test indexer failed: HTTP {r.status_code}: {text}") from e
+            raise IndexerTestError(f"Test indexer failed: HTTP {r.status_code}: {text}", r.status_code) from e
         # If JSON, return dict/list; otherwise return raw text for diagnostics
         try:
-            return r.json()
+            return _decode(r.content, r.headers.get('Content-Type', ''))
         except Exception:
             return { 'response_text': r.text }
 
-    def update_indexer(self, idx_id: int, indexer_obj: Dict[str, Any]) -> Dict[str, Any]:
-        r = self.session.put(self._url(f'indexer/{idx_id}'), json=indexer_obj, timeout=self.timeout)
+    def update_indexer(self, idx_id: int, indexer_obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Save an indexer and return the saved copy from the response body, or None
+        when the server sends no body.
+        """
+        r = self.session.put(self._u_indexer_fmt % idx_id, data=_dumps(indexer_obj), timeout=self.timeout)
         r.raise_for_status()
-        return r.json()
+        if not r.content:
+            self._indexer_cache.pop(idx_id, None)
+            return None
+        content_type = r.headers.get('Content-Type', '')
+        self._indexer_cache[idx_id] = (time.monotonic(), r.content, content_type)
+        return _decode(r.content, content_type)
 
     def get_tags(self) -> List[Dict[str, Any]]:
-        r = self.session.get(self._url('tag'))
-        r.raise_for_status()
-        return r.json()
+        if self._tag_cache is not None and time.monotonic() - self._tag_cache_ts < self.cache_ttl:
+            return list(self._tag_cache)
+        tags = self._cached_get(self._u_tag)
+        by_label = {}
+        for t in tags:
+            if isinstance(t, dict):
+                by_label.setdefault(t.get('label'), t)
+        self._tag_cache = tags
+        self._tag_by_label = by_label
+        self._tag_cache_ts = time.monotonic()
+        return list(tags)
 
     def create_tag(self, label: str) -> Dict[str, Any]:
-        r = self.session.post(self._url('tag'), json={'label': label})
+        r = self.session.post(self._u_tag, data=_dumps({'label': label}), timeout=self.timeout)
         r.raise_for_status()
-        return r.json()
+        tag = _decode(r.content, r.headers.get('Content-Type', ''))
+        # keep the cache coherent rather than forcing a refetch
+        if self._tag_cache is not None and isinstance(tag, dict):
+            self._tag_cache.append(tag)
+            self._tag_by_label.setdefault(tag.get('label'), tag)
+        return tag
 
     def find_or_create_tag(self, label: str) -> Dict[str, Any]:
-        tags = self.get_tags()
-        for t in tags:
-            if t.get('label') == label:
-                return t
+        self.get_tags()
+        hit = self._tag_by_label.get(label)
+        if hit is not None:
+            return hit
         return self.create_tag(label)
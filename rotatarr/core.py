@@ -0,0 +1,987 @@
+"""Indexer health checks and recovery for Prowlarr; the root rotatarr.py runs main()."""
+import os
+import signal
+import time
+import threading
+import logging
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+import requests
+
+from prowlarr_client import IndexerTestError, ProwlarrClient
+
+try:
+    import orjson
+except ImportError:  # keep booting without the wheel; stdlib json is the fallback
+    orjson = None
+
+# NOTE: Environment variables come from docker-compose.yml only (no .env file)
+
+PROWLARR_URL = os.environ.get('PROWLARR_URL')
+PROWLARR_API_KEY = os.environ.get('PROWLARR_API_KEY')
+CHECK_INTERVAL_MIN = int(os.environ.get('CHECK_INTERVAL_MIN', '30'))
+TEST_RETRIES = int(os.environ.get('TEST_RETRIES', '2'))
+TEST_RETRY_DELAY_SEC = float(os.environ.get('TEST_RETRY_DELAY_SEC', '1'))
+TAG_TO_TRY = os.environ.get('TAG_TO_TRY', '')
+TAG_FORCE = os.environ.get('TAG_FORCE', 'false').lower() in ('1', 'true', 'yes')
+DRY_RUN = os.environ.get('DRY_RUN', 'true').lower() in ('1', 'true', 'yes')
+APPLY_TAG_SAVE_BEFORE_TEST = os.environ.get('APPLY_TAG_SAVE_BEFORE_TEST', 'false').lower() in ('1','true','yes')
+FORCE_TEST_INDEXERS = os.environ.get('FORCE_TEST_INDEXERS', '')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+ONE_SHOT = os.environ.get('ONE_SHOT', 'false').lower() in ('1', 'true', 'yes')
+INDEXER_MAX_ATTEMPTS = int(os.environ.get('INDEXER_MAX_ATTEMPTS', '3'))
+INDEXER_COOLDOWN_MIN = int(os.environ.get('INDEXER_COOLDOWN_MIN', '60'))
+INDEXER_STATE_FILE = os.environ.get('INDEXER_STATE_FILE', '/app/data/indexer_state.json')
+TEST_AS_UI = os.environ.get('TEST_AS_UI', 'false').lower() in ('1','true','yes')
+INSPECT_INDEXERS = os.environ.get('INSPECT_INDEXERS', 'false').lower() in ('1','true','yes')
+DUMP_INDEXERS = os.environ.get('DUMP_INDEXERS', '')
+INDEXER_WORKERS = max(1, int(os.environ.get('INDEXER_WORKERS', '8')))
+PREFILTER_CANDIDATES = os.environ.get('PREFILTER_CANDIDATES', 'false').lower() in ('1','true','yes')
+
+logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger('rotatarr')
+
+# the state file location is fixed for the life of the process, so its directory is created
+# once, by the first save, rather than on every save (or as a side effect of importing)
+_INDEXER_STATE_DIR = os.path.dirname(INDEXER_STATE_FILE)
+_INDEXER_STATE_TMP = INDEXER_STATE_FILE + '.tmp'
+_indexer_state_dir_ready = False
+
+_client: Optional[ProwlarrClient] = None
+
+
+def make_client() -> Optional[ProwlarrClient]:
+    """Return the process-wide client, creating it on first use so every run
+    cycle shares one session and its pool of keep-alive connections.
+    """
+    global _client
+    if _client is not None:
+        return _client
+    if not PROWLARR_URL or not PROWLARR_API_KEY:
+        logger.error('PROWLARR_URL and PROWLARR_API_KEY must be set to use the API. Some functions will still work locally.')
+        return None
+    _client = ProwlarrClient(PROWLARR_URL, PROWLARR_API_KEY)
+    return _client
+
+
+def _json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _json_dumps(obj: Any, indent: bool = False) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(obj, default=str, indent=2 if indent else None)
+
+
+# later runs reuse the in-memory copy, which every save keeps in sync with what is on
+# disk; the file is only read again when its mtime shows it was changed by someone else
+_indexer_state: Optional[Dict[str, Any]] = None
+_indexer_state_mtime: Optional[int] = None
+
+
+def _state_file_mtime() -> Optional[int]:
+    try:
+        return os.stat(INDEXER_STATE_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_indexer_state() -> Dict[str, Any]:
+    global _indexer_state, _indexer_state_mtime
+    mtime = _state_file_mtime()
+    if _indexer_state is not None and mtime == _indexer_state_mtime:
+        return _indexer_state
+    state = {}
+    try:
+        if mtime is not None:
+            with open(INDEXER_STATE_FILE, 'rb') as fh:
+                state = _json_loads(fh.read()) or {}
+    except Exception as e:
+        logger.debug("Unable to load indexer state from %s: %s", INDEXER_STATE_FILE, e)
+    _indexer_state = state
+    _indexer_state_mtime = mtime
+    return state
+
+
+# how many indexers run_once processes between flushes of pending state changes
+_STATE_FLUSH_EVERY = 25
+
+
+def _save_indexer_state(state: Dict[str, Any]) -> None:
+    global _indexer_state, _indexer_state_mtime, _indexer_state_dir_ready
+    _indexer_state = state
+    if not _indexer_state_dir_ready:
+        try:
+            if _INDEXER_STATE_DIR:
+                os.makedirs(_INDEXER_STATE_DIR, exist_ok=True)
+            _indexer_state_dir_ready = True
+        except Exception as e:
+            logger.debug("Unable to create indexer state directory %s: %s", _INDEXER_STATE_DIR, e)
+    try:
+        # write to a sibling temp file and swap it in so a crash mid-write can't truncate the state
+        with open(_INDEXER_STATE_TMP, 'wb') as fh:
+            # compact separators match orjson's output and keep the stdlib fallback's file small
+            fh.write(orjson.dumps(state) if orjson is not None
+                     else json.dumps(state, separators=(',', ':')).encode('utf-8'))
+        os.replace(_INDEXER_STATE_TMP, INDEXER_STATE_FILE)
+        _indexer_state_mtime = _state_file_mtime()
+    except Exception as e:
+        logger.warning(f"Failed to save indexer state to {INDEXER_STATE_FILE}: {e}")
+
+
+# Common definition fields: Prowlarr says an indexer "has no definition and will not work"
+# when all of these are missing
+_DEF_FIELDS = ('definition', 'definitionId', 'definitionUid', 'implementation')
+_DEFINITION_FILE_FIELD = 'definitionfile'
+
+
+def is_indexer_error(indexer: Dict[str, Any]) -> bool:
+    if not isinstance(indexer, dict):
+        return False
+    get = indexer.get
+    # heuristics: look for common error fields
+    # Older API / variations might be a string state
+    state_field = get('status') or get('state') or get('Status')
+    if isinstance(state_field, str):
+        if state_field.lower() == 'error':
+            return True
+    # Schema based: 'status' is a dict (IndexerStatusResource)
+    elif isinstance(state_field, dict):
+        if state_field.get('mostRecentFailure') or state_field.get('initialFailure'):
+            return True
+    # Some objs include a configContract string rather than dict; skip
+    config_contract = get('configContract')
+    if isinstance(config_contract, dict) and config_contract.get('name') == 'error':
+        return True
+    # 'error' message, or last update error message
+    if get('error') or get('errors') or get('LastException') or get('lastError'):
+        return True
+    # Heuristic: indexer has no definition - flag it if every definition-like field is missing or empty
+    if all(not get(k) for k in _DEF_FIELDS):
+        return True
+    # Additionally inspect fields array for 'definitionFile' or similar settings that are empty
+    fields = get('fields')
+    if isinstance(fields, list):
+        for f in fields:
+            if isinstance(f, dict):
+                name = f.get('name')
+                if isinstance(name, str) and name.lower() == _DEFINITION_FILE_FIELD:
+                    val = f.get('value')
+                    if not val and val != 0:
+                        return True
+    # check provider message (ProviderMessage) type 'error'
+    message = get('message')
+    if isinstance(message, dict) and message.get('type') == 'error':
+        return True
+    return False
+
+
+# upper bound on candidates gathered per indexer; real indexers rarely have more than a handful
+_MAX_BASE_URL_CANDIDATES = 16
+
+
+def _iter_base_url_candidates(indexer: Dict[str, Any]) -> Iterator[str]:
+    """Yield candidate base URLs lazily, so callers can stop once they have enough."""
+    # Common Prowlarr indexer fields
+    # Try Settings.BaseUrl or Config.Settings.BaseUrl
+    settings = indexer.get('settings') or indexer.get('Settings') or indexer.get('Settings', {})
+    if isinstance(settings, dict):
+        baseurl = settings.get('baseUrl') or settings.get('BaseUrl') or settings.get('BaseUrl')
+        if baseurl:
+            yield baseurl
+    # Try 'indexerUrls', 'legacyUrls', 'urls', 'alternateUrls'
+    urls = indexer.get('indexerUrls') or indexer.get('indexerurls') or indexer.get('urls') or indexer.get('Urls') or indexer.get('alternateUrls') or indexer.get('AlternateUrls') or indexer.get('legacyUrls') or indexer.get('legacyurls')
+    if isinstance(urls, list):
+        for u in urls:
+            if isinstance(u, str) and u:
+                yield u
+    # Some definitions store config in 'config' or 'settings
+    config = indexer.get('config') or indexer.get('Config') or indexer.get('configContract') or {}
+    # If there are config fields with 'baseUrl', add them; configContract is often just
+    # the contract name string, which has nothing to scan
+    if isinstance(config, dict):
+        for v in config.values():
+            if isinstance(v, str) and v.startswith('http'):
+                yield v
+    # Fields entries can include URLs
+    fields = indexer.get('fields')
+    if isinstance(fields, list):
+        for f in fields:
+            if isinstance(f, dict):
+                v = f.get('value') or f.get('Value')
+                if isinstance(v, str) and v.startswith('http'):
+                    yield v
+
+
+def get_alternate_base_urls(indexer: Dict[str, Any]) -> List[str]:
+    # Deduplicate (keeping first-seen order), stopping the walk once the cap is reached.
+    # Spellings differing only in case or a trailing slash count as one candidate; the
+    # first one seen is kept as-is, since Prowlarr stores base URLs with the slash
+    seen: Dict[str, str] = {}
+    for url in _iter_base_url_candidates(indexer):
+        seen.setdefault(url.rstrip('/').lower(), url)
+        if len(seen) >= _MAX_BASE_URL_CANDIDATES:
+            break
+    return list(seen.values())
+
+
+# keys kept in the UI-like test payload, in payload order, with the type each must have
+# (object for the identity fields, which are kept whatever their type)
+_UI_KEYS = (('id', object), ('name', object), ('implementation', object), ('definitionId', object),
+            ('definitionUid', object), ('settings', dict), ('fields', list), ('indexerUrls', list),
+            ('legacyUrls', list))
+
+
+_PROBE_TIMEOUT_SEC = 3.0
+# probe session for candidate hosts; deliberately separate from the Prowlarr client so the
+# API key header is never sent to third-party mirrors
+_probe_session: Optional[requests.Session] = None
+# probe results by (candidate, hour), so a candidate is probed at most once an hour
+_probe_cache: Dict[Tuple[str, int], bool] = {}
+# indexer workers prefilter concurrently; guards _probe_session creation and _probe_cache
+_probe_lock = threading.Lock()
+
+
+def _probe_candidate(url: str, timeout: float) -> bool:
+    """Return False only when url can't be reached at all (DNS, connect or timeout);
+    any HTTP answer counts as reachable, since Cloudflare-fronted mirrors reply 403/503
+    to plain clients and still work through Prowlarr.
+    """
+    try:
+        _probe_session.head(url, timeout=timeout, allow_redirects=True)
+    except (requests.ConnectionError, requests.Timeout):
+        return False
+    except requests.RequestException:
+        pass
+    return True
+
+
+def prefilter_candidates(base_urls: List[str], timeout: float = _PROBE_TIMEOUT_SEC) -> List[str]:
+    """Drop candidate base URLs that don't answer a quick HEAD, probing them concurrently.
+    If none answer the probe is treated as inconclusive (e.g. no direct internet access
+    from here) and every candidate is kept.
+    """
+    global _probe_session
+    hour = int(time.time() // 3600)
+    with _probe_lock:
+        if _probe_session is None:
+            _probe_session = requests.Session()
+        pending = [u for u in base_urls if (u, hour) not in _probe_cache]
+        if pending:
+            for key in [k for k in _probe_cache if k[1] != hour]:
+                del _probe_cache[key]
+    if pending:
+        # probe outside the lock so other workers aren't held up by slow hosts
+        with ThreadPoolExecutor(max_workers=min(len(pending), 8)) as ex:
+            probed = list(zip(pending, ex.map(lambda u: _probe_candidate(u, timeout), pending)))
+        with _probe_lock:
+            for url, ok in probed:
+                _probe_cache[(url, hour)] = ok
+    with _probe_lock:
+        reachable = [u for u in base_urls if _probe_cache.get((u, hour), True)]
+    if not reachable:
+        logger.debug("No candidate answered the reachability probe; keeping all of %s", base_urls)
+        return base_urls
+    return reachable
+
+
+def ui_minimal_fields(indexer: Dict[str, Any]) -> Tuple[str, ...]:
+    """Return the keys of indexer that go into the UI-like test payload. Base URL and
+    tag clones keep the same keys and types, so the result can be reused for them.
+    """
+    return tuple(k for k, t in _UI_KEYS if k in indexer and isinstance(indexer[k], t))
+
+
+def build_ui_test_payload(indexer: Dict[str, Any], fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+    """Return a minimal payload resembling what the UI would send when testing.
+    This payload includes only the most common fields Prowlarr cares about, reducing
+    noise and making it more likely to follow the UI path that may use proxies or
+    other server-configured helpers. An indexer that is already UI-shaped is returned
+    as-is, so callers can tell "nothing to strip" apart with an identity check.
+    fields, from ui_minimal_fields, saves recomputing the key list for clones.
+    """
+    if fields is None:
+        fields = ui_minimal_fields(indexer)
+    # every key kept means there is nothing to strip
+    if len(fields) == len(indexer):
+        return indexer
+    return {k: indexer[k] for k in fields}
+
+
+def _current_base_url(indexer: Dict[str, Any]) -> Optional[str]:
+    """Return the base URL a test of indexer would use: the value set_base_url would
+    overwrite, read from the same place it writes to.
+    """
+    settings = indexer.get('settings')
+    if isinstance(settings, dict):
+        return settings.get('baseUrl') or settings.get('BaseUrl')
+    config = indexer.get('config')
+    if isinstance(config, dict):
+        return next((config[k] for k in ('baseUrl', 'BaseUrl', 'url', 'Url') if k in config), None)
+    fields = indexer.get('fields')
+    if isinstance(fields, list):
+        entries = [f for f in fields if isinstance(f, dict)]
+        field = next((f for f in entries if str(f.get('name', '')).lower() == 'baseurl'), None)
+        if field is None:
+            field = next((f for f in entries if isinstance(f.get('value'), str) and f['value'].startswith('http')), None)
+        if field is not None:
+            return field.get('value')
+    return indexer.get('BaseUrl')
+
+
+def set_base_url(indexer: Dict[str, Any], url: str) -> None:
+    # attempt common fields to set, most specific container first
+    settings = indexer.get('settings')
+    if isinstance(settings, dict):
+        keys = [k for k in ('baseUrl', 'BaseUrl') if k in settings] or ['baseUrl']
+        for k in keys:
+            settings[k] = url
+        return
+    config = indexer.get('config')
+    if isinstance(config, dict):
+        # replace whichever key looks like the base url, else add baseUrl
+        key = next((k for k in ('baseUrl', 'BaseUrl', 'url', 'Url') if k in config), 'baseUrl')
+        config[key] = url
+        return
+    # Prowlarr's API shape: the base url is the 'baseUrl' entry of the fields list;
+    # otherwise replace the first URL-like field value
+    fields = indexer.get('fields')
+    if isinstance(fields, list):
+        entries = [f for f in fields if isinstance(f, dict)]
+        field = next((f for f in entries if str(f.get('name', '')).lower() == 'baseurl'), None)
+        if field is None:
+            field = next((f for f in entries if isinstance(f.get('value'), str) and f['value'].startswith('http')), None)
+        if field is not None:
+            field['value'] = url
+            return
+    # last fallback: set top-level 'BaseUrl'
+    indexer['BaseUrl'] = url
+
+
+def add_tag_to_indexer(indexer: Dict[str, Any], tag: Any) -> None:
+    """Add a tag (either id or tag object) to an indexer object payload.
+    Ensures both 'tagIds' (list of ints) and 'tags' (list of objects) are set to maximize Prowlarr compatibility.
+    """
+    tag_id = None
+    tag_label = None
+    if isinstance(tag, dict):
+        tag_id = tag.get('id')
+        tag_label = tag.get('label') or tag.get('name')
+    else:
+        tag_id = tag
+    # Add numeric tag id to tagIds
+    if tag_id is not None:
+        try:
+            tag_id_int = int(tag_id)
+        except Exception:
+            tag_id_int = None
+    else:
+        tag_id_int = None
+    if tag_id_int is not None:
+        if 'tagIds' in indexer and isinstance(indexer['tagIds'], list):
+            if tag_id_int not in indexer['tagIds']:
+                indexer['tagIds'].append(tag_id_int)
+        else:
+            indexer['tagIds'] = [tag_id_int]
+    # Also add an object to 'tags' list for UI / object-based expectations
+    if tag_label and tag_id_int is not None:
+        tag_obj = {'id': tag_id_int, 'label': tag_label}
+        if 'tags' in indexer and isinstance(indexer['tags'], list):
+            if not any(isinstance(t, dict) and t.get('id') == tag_id_int for t in indexer['tags']):
+                indexer['tags'].append(tag_obj)
+        else:
+            indexer['tags'] = [tag_obj]
+
+
+def _clone_indexer_for_test(indexer: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of indexer that set_base_url and add_tag_to_indexer can modify
+    without touching the source: the containers they write to are copied, everything
+    else (capabilities, categories, ...) is shared.
+    """
+    clone = dict(indexer)
+    for k in ('settings', 'config'):
+        if isinstance(clone.get(k), dict):
+            clone[k] = dict(clone[k])
+    if isinstance(clone.get('fields'), list):
+        clone['fields'] = [dict(f) if isinstance(f, dict) else f for f in clone['fields']]
+    for k in ('tagIds', 'tags'):
+        if isinstance(clone.get(k), list):
+            clone[k] = list(clone[k])
+    return clone
+
+
+def _resolve_tag(client: ProwlarrClient) -> Optional[Dict[str, Any]]:
+    """Return the TAG_TO_TRY tag object, creating the tag if needed; a placeholder in DRY_RUN.
+    Returns None when the tag can't be looked up or created, so nothing gets saved with a fake id.
+    """
+    if DRY_RUN:
+        # pretend id is a placeholder
+        return {'id': -1, 'label': TAG_TO_TRY}
+    try:
+        return client.find_or_create_tag(TAG_TO_TRY)
+    except Exception as e:
+        logger.warning(f"Failed to find/create tag {TAG_TO_TRY}; tag plans are skipped this run: {e}")
+        return None
+
+
+_SUCCESS_KEYS = ('success', 'isSuccess')
+
+
+def _is_test_ok(res: Any) -> bool:
+    """Return True if an indexer test response reports success.
+    Dict responses pass on a success/isSuccess flag or, failing that, any boolean
+    True value; list responses pass if any entry has success True or status 'Success'.
+    """
+    if isinstance(res, dict):
+        return any(res.get(k) is True for k in _SUCCESS_KEYS) or any(v is True for v in res.values())
+    if isinstance(res, list):
+        return any(isinstance(r, dict) and (r.get('success') is True or r.get('status') == 'Success') for r in res)
+    return False
+
+
+_TEST_RETRY_MAX_DELAY_SEC = 5.0
+
+
+def _is_transient_test_error(e: Exception) -> bool:
+    """Whether a failed test is worth retrying: rate limiting, server errors and
+    connection problems are; a 4xx means Prowlarr rejected the test and retrying
+    the same payload won't change that.
+    """
+    status = getattr(e, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    msg = str(e).lower()
+    return '429' in msg or 'toomanyrequests' in msg or 'timeout' in msg
+
+
+def _update_and_refresh(client: ProwlarrClient, idx_id: Any, indexer: Dict[str, Any]) -> Dict[str, Any]:
+    """Save indexer and return the server's copy of it. Prowlarr answers a PUT with the
+    saved indexer, so that is used directly; only an empty response costs a GET.
+    """
+    resp = client.update_indexer(idx_id, indexer)
+    logger.debug("Update response for indexer %s: %s", idx_id, resp)
+    if isinstance(resp, dict) and resp:
+        return resp
+    return client.get_indexer(idx_id)
+
+
+def _perform_test_with_retries(client: ProwlarrClient, test_obj: Dict[str, Any], ref_id: Any, label: str) -> bool:
+    """Return True if test succeeds, False otherwise; logs and raises on hard failures."""
+    test_res = None
+    for attempt in range(0, TEST_RETRIES + 1):
+        try:
+            test_res = client.test_indexer(test_obj)
+            if _is_test_ok(test_res):
+                return True
+            # if not ok and not transient, no need to retry
+            logger.debug("Test attempt returned not-ok for %s (%s): %s", ref_id, label, test_res)
+            if TEST_AS_UI:
+                try:
+                    ui_payload = build_ui_test_payload(test_obj if isinstance(test_obj, dict) else {})
+                    if ui_payload and ui_payload is not test_obj:
+                        logger.info(f"Attempting UI-like minimal payload test for {ref_id} ({label})")
+                        # Try UI-like payload without additional retries here; let the caller's loop handle retries
+                        if _is_test_ok(client.test_indexer(ui_payload)):
+                            return True
+                except Exception:
+                    # swallow and continue with false return below
+                    pass
+            return False
+        except Exception as e:
+            # If retriable, try again after a truncated exponential backoff
+            if attempt < TEST_RETRIES and _is_transient_test_error(e):
+                logger.warning(f"Transient error on test attempt {attempt + 1} for {label} ({ref_id}): {e}; retrying after backoff")
+                time.sleep(min(TEST_RETRY_DELAY_SEC * 2 ** attempt, _TEST_RETRY_MAX_DELAY_SEC))
+                continue
+            # non-retriable, return False
+            logger.debug("Non-retriable error during test for %s (%s): %s", label, ref_id, e)
+            raise
+
+
+def _cached_test(client: ProwlarrClient, cache: Dict[Any, Any], key: Any, test_obj: Dict[str, Any],
+                 ref_id: Any, label: str) -> bool:
+    """_perform_test_with_retries, remembering the outcome under key for the rest of the run.
+    A failed test usually comes back as an HTTP 400 and raises, so its status and message
+    are remembered too and a fresh IndexerTestError is raised on a hit (the original
+    exception isn't kept, since other workers would re-raise the same object). Pass
+    key=None for payloads that can't be compared (e.g. after persisting to the server).
+    """
+    if key is not None and key in cache:
+        hit = cache[key]
+        logger.debug("Reusing earlier test result for %s (%s): %s", ref_id, label, hit)
+        if isinstance(hit, tuple):
+            raise IndexerTestError(hit[1], hit[0])
+        return hit
+    try:
+        ok = _perform_test_with_retries(client, test_obj, ref_id, label)
+    except Exception as e:
+        if key is not None:
+            cache[key] = (getattr(e, 'status_code', None), str(e))
+        raise
+    if key is not None:
+        cache[key] = ok
+    return ok
+
+
+class _RunContext:
+    """Data shared by the indexer workers of one run_once call; the locks guard the
+    result lists, the indexer state and the lazily resolved tag.
+    """
+    def __init__(self, client: ProwlarrClient, status_map: Dict[Any, Dict[str, Any]], indexer_state: Dict[str, Any]):
+        self.client = client
+        self.status_map = status_map
+        self.indexer_state = indexer_state
+        self.results: Dict[str, List[Any]] = {'fixed': [], 'skipped': [], 'failed': []}
+        # names/ids that bypass the cooldown; parsed once per run rather than per indexer
+        self.forced_names = frozenset(n.strip().lower() for n in FORCE_TEST_INDEXERS.split(',') if n.strip())
+        # one clock reading per run for cooldown checks and new cooldown deadlines
+        self.now_ts = int(time.time())
+        # outcomes of tests already run this cycle, keyed by what was sent: (indexer id, effective
+        # base url, tag id or None, 'raw' | 'ui'). Step 2's candidate equal to the current base url
+        # repeats step 1, and UI payloads carry no tags, so a tagged UI test repeats the plain one
+        self.test_cache: Dict[Any, Any] = {}
+        # state changes are buffered and written by flush_state
+        self.state_dirty = False
+        self._results_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._tag_lock = threading.Lock()
+        self._tag_obj: Optional[Dict[str, Any]] = None
+        self._tag_resolved = False
+
+    def add_result(self, kind: str, item: Any) -> None:
+        with self._results_lock:
+            self.results[kind].append(item)
+
+    def get_state(self, state_key: str) -> Dict[str, Any]:
+        """Return a copy of the indexer's state entry, safe to modify and pass to set_state."""
+        with self._state_lock:
+            return dict(self.indexer_state.get(state_key, {}))
+
+    def set_state(self, state_key: str, idx_state: Dict[str, Any]) -> None:
+        with self._state_lock:
+            self.indexer_state[state_key] = idx_state
+            self.state_dirty = True
+
+    def clear_state(self, state_key: str) -> None:
+        with self._state_lock:
+            if self.indexer_state.pop(state_key, None) is not None:
+                self.state_dirty = True
+
+    def prune_state(self, live_keys: frozenset) -> None:
+        """Drop entries for indexers that no longer exist in Prowlarr and entries whose
+        cooldown has run out with no failures left to count, so the state file holds
+        only indexers that still need tracking. An empty live_keys (no indexers listed, or
+        none with an id) says nothing about which indexers exist, so nothing is pruned.
+        """
+        if not live_keys:
+            return
+        with self._state_lock:
+            stale = [k for k, v in self.indexer_state.items()
+                     if k not in live_keys or not isinstance(v, dict)
+                     or (not v.get('consecutive_failures') and (v.get('next_allowed_at') or 0) <= self.now_ts)]
+            for k in stale:
+                del self.indexer_state[k]
+            if stale:
+                logger.debug("Pruned %s stale indexer state entries: %s", len(stale), stale)
+                self.state_dirty = True
+
+    def flush_state(self) -> None:
+        with self._state_lock:
+            if self.state_dirty:
+                _save_indexer_state(self.indexer_state)
+                self.state_dirty = False
+
+    def get_tag(self) -> Optional[Dict[str, Any]]:
+        """TAG_TO_TRY is looked up (or created) once per run, the first time an indexer needs it;
+        None (also cached for the run) when that failed.
+        """
+        with self._tag_lock:
+            if not self._tag_resolved:
+                self._tag_obj = _resolve_tag(self.client)
+                self._tag_resolved = True
+            return self._tag_obj
+
+
+def _plan_payload(idx: Dict[str, Any], candidate: Optional[str], tag: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return idx with the candidate base URL and/or tag applied (None leaves that part as-is)."""
+    if candidate is None and tag is None:
+        return idx
+    payload = _clone_indexer_for_test(idx)
+    if candidate is not None:
+        set_base_url(payload, candidate)
+    if tag is not None:
+        add_tag_to_indexer(payload, tag)
+    return payload
+
+
+def _plan_label(candidate: Optional[str], tag: Optional[Dict[str, Any]]) -> str:
+    label = candidate or 'as-is'
+    if tag is not None:
+        label += f" + tag {TAG_TO_TRY}"
+    return label
+
+
+def _test_payload(run: _RunContext, payload: Dict[str, Any], idx_id: Any, label: str,
+                  raw_key: Any = None, ui_key: Any = None,
+                  ui_fields: Optional[Tuple[str, ...]] = None) -> bool:
+    """Test payload, falling back to the UI-like minimal payload when the full one doesn't
+    pass. raw_key/ui_key cache the outcomes in run.test_cache; None tests uncached.
+    """
+    try:
+        if _cached_test(run.client, run.test_cache, raw_key, payload, idx_id, label):
+            return True
+        logger.info(f"Test for {label} failed for {idx_id}")
+    except Exception as e:
+        logger.info(f"Test for {label} raised exception for {idx_id}: {e}")
+        # serializing the payload is costly; only do it when debug output is on
+        if logger.isEnabledFor(logging.DEBUG):
+            try:
+                logger.debug("Test payload: %s", _json_dumps(payload)[:4000])
+            except Exception:
+                pass
+    # a UI-like minimal payload may trigger a different server path
+    ui_payload = build_ui_test_payload(payload, ui_fields)
+    if ui_payload is not payload:
+        try:
+            logger.info(f"Testing {label} with minimal UI-like payload for {idx_id}")
+            if _cached_test(run.client, run.test_cache, ui_key, ui_payload, idx_id, f"{label} (UI payload)"):
+                return True
+        except Exception as e:
+            logger.debug("UI payload test for %s raised exception for %s: %s", label, idx_id, e)
+    return False
+
+
+def _test_plan(run: _RunContext, idx: Dict[str, Any], idx_id: Any, candidate: Optional[str],
+               tag: Optional[Dict[str, Any]], ui_fields: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, Any]]:
+    """Test idx with the candidate base URL and/or tag applied (None leaves that part as-is),
+    without saving anything. Returns the full payload, which is what gets saved, if it or
+    its UI-like variant passed. ui_fields is idx's ui_minimal_fields, computed once by the caller.
+    """
+    payload = _plan_payload(idx, candidate, tag)
+    tag_id = tag.get('id') if isinstance(tag, dict) else tag
+    base_url = candidate if candidate is not None else _current_base_url(idx)
+    # the UI payload drops tagIds/tags, so the tag is not part of its key
+    if _test_payload(run, payload, idx_id, _plan_label(candidate, tag),
+                     (idx_id, base_url, tag_id, 'raw'), (idx_id, base_url, None, 'ui'), ui_fields):
+        return payload
+    return None
+
+
+def _persist_plan(client: ProwlarrClient, idx: Dict[str, Any], idx_id: Any, candidate: Optional[str],
+                  tag: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Save idx with the candidate base URL and/or tag applied and return the server's copy,
+    which is what the test should then see. idx itself is left untouched.
+    """
+    return _update_and_refresh(client, idx_id, _plan_payload(idx, candidate, tag))
+
+
+def _process_indexer(run: _RunContext, idx: Dict[str, Any]) -> None:
+    """Check one indexer and try to recover it if it is failing; outcomes go to run."""
+    if _stop_event.is_set():
+        # shutting down: leave indexers that haven't started yet for the next run
+        return
+    client = run.client
+    idx_id = idx.get('id') or idx.get('Id')
+    if not idx_id:
+        logger.debug('Indexer missing id; skipping')
+        run.add_result('skipped', idx)
+        return
+    idx_name = idx.get('name', idx_id)
+    name_lower = idx_name.lower() if isinstance(idx_name, str) else ''
+    # Prefer indexer status endpoint for error detection
+    s = run.status_map.get(idx_id)
+    if s and (s.get('mostRecentFailure') or s.get('disabledTill')):
+        logger.info(f"Indexer {idx_name} ({idx_id}) has failure status; attempting to recover")
+    else:
+        # fallback to existing heuristics
+        # Only skip if we don't have a status showing failures AND heuristics don't detect an error
+        if not (s and (s.get('mostRecentFailure') or s.get('disabledTill'))) and not is_indexer_error(idx):
+            logger.debug("Indexer %s (%s) not marked as error; skipping", idx_name, idx_id)
+            return
+    if not isinstance(idx, dict):
+        logger.warning(f"Index entry is not a dict; skipping: {idx}")
+        run.add_result('skipped', idx)
+        return
+    try:
+        idx_id = idx.get('id') or idx.get('Id')
+        if not idx_id:
+            logger.debug('Indexer missing id; skipping')
+            run.add_result('skipped', idx)
+            return
+        # check cooldown first so skipped indexers don't pay for the copy, URL scan and tag lookup
+        state_key = str(idx_id)
+        now_ts = run.now_ts
+        idx_state = run.get_state(state_key)
+        next_allowed_at = idx_state.get('next_allowed_at')
+        # check forced tests override
+        forced_by_name = name_lower in run.forced_names
+        forced_by_id = str(idx_id) in run.forced_names
+        if next_allowed_at and now_ts < next_allowed_at and not (forced_by_name or forced_by_id):
+            logger.info(f"Indexer {idx_name} ({idx_id}) is in cooldown until {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_allowed_at))}; skipping")
+            run.add_result('skipped', idx)
+            return
+
+        # At this point we know indexer either has a status-based failure or heuristics indicate an error
+        logger.info(f"Indexer {idx_name} ({idx_id}) appears to be in error; attempting to recover")
+        original = _clone_indexer_for_test(idx)
+        # every test payload below is a base URL/tag clone of idx, so they share one UI key list
+        ui_fields = ui_minimal_fields(idx)
+        # set once a change is saved to Prowlarr before testing; only then is there anything to revert
+        persisted_changes = False
+        base_urls = get_alternate_base_urls(idx)
+        logger.debug("Candidate base URLs for %s: %s", idx_name, base_urls)
+        if not base_urls:
+            logger.info(f"No base URL candidates for indexer {idx_name}; skipping")
+            run.add_result('skipped', idx)
+            return
+        updated = False
+        tag_obj = None
+        if TAG_TO_TRY and TAG_FORCE:
+            tag_obj = run.get_tag()
+            if tag_obj is not None:
+                logger.info(f"Using tag {tag_obj}")
+
+        # 1) Try indexer as-is (then as a UI-like minimal payload, which can follow a
+        # different server code path and may succeed where the full payload doesn't)
+        logger.info(f"Testing indexer as-is for {idx_name}")
+        if _test_plan(run, idx, idx_id, None, None, ui_fields) is not None:
+            logger.info(f"Index {idx_name} ({idx_id}) OK as-is; marking fixed (no update)")
+            run.add_result('fixed', {'indexer': idx, 'new_base_url': None, 'tag': None})
+            # clear any failure state for indexer
+            run.clear_state(state_key)
+            return
+
+        # 2) Try candidate base URLs concurrently and keep the first one that passes
+        if PREFILTER_CANDIDATES:
+            reachable = prefilter_candidates(base_urls)
+            if len(reachable) < len(base_urls):
+                logger.info(f"Skipping unreachable candidates for {idx_name}: {[u for u in base_urls if u not in reachable]}")
+            base_urls = reachable
+        if TAG_TO_TRY and tag_obj is None:
+            # resolve the tag before the candidate workers start
+            tag_obj = run.get_tag()
+        # each candidate is tried plain, then with the tag if one is configured and could be resolved
+        candidate_tags = (None, tag_obj) if tag_obj is not None else (None,)
+
+        def _try_candidate(candidate: str):
+            """Run the candidate's test plans without persisting anything.
+            Returns (payload_to_save, tag_used) for the first plan that passes.
+            """
+            logger.info(f"Testing candidate base URL {candidate}")
+            for tag in candidate_tags:
+                payload = _test_plan(run, idx, idx_id, candidate, tag, ui_fields)
+                if payload is not None:
+                    return payload, tag
+            return None
+
+        # each test is a slow Prowlarr round-trip, so race the candidates instead
+        # of paying for them one after another
+        ex = ThreadPoolExecutor(max_workers=min(len(base_urls), 4))
+        try:
+            futures = {ex.submit(_try_candidate, c): c for c in base_urls}
+            for fut in as_completed(futures):
+                win = fut.result()
+                if win is None:
+                    continue
+                candidate = futures[fut]
+                payload, used_tag = win
+                logger.info(f"Candidate base URL {candidate}{f' + tag {TAG_TO_TRY}' if used_tag is not None else ''} works; saving indexer")
+                if not DRY_RUN:
+                    client.update_indexer(idx_id, payload)
+                run.add_result('fixed', {'indexer': idx, 'new_base_url': candidate, 'tag': used_tag})
+                # clear any failure state for indexer
+                run.clear_state(state_key)
+                updated = True
+                break
+        finally:
+            # don't wait for candidates still in flight once one has won
+            ex.shutdown(wait=False, cancel_futures=True)
+
+        # 3) Nothing worked on its own; retry the original with the tag
+        if not updated and tag_obj is not None:
+            if APPLY_TAG_SAVE_BEFORE_TEST and not DRY_RUN:
+                # Persist each plan to Prowlarr first so the server's 'test' uses the saved
+                # configuration; results depend on what was saved, so they aren't cached.
+                # Every plan is built from the unmodified idx, and the revert below restores
+                # the original if none passes
+                current = _current_base_url(idx)
+                for candidate in (None, *(c for c in base_urls if c != current)):
+                    label = _plan_label(candidate, tag_obj)
+                    logger.info(f"Persisting {label} to indexer {idx_name} ({idx_id}) before testing")
+                    # set before the save: the PUT may land even if reading the saved copy back fails
+                    persisted_changes = True
+                    try:
+                        saved = _persist_plan(client, idx, idx_id, candidate, tag_obj)
+                    except Exception as e:
+                        logger.warning(f"Failed to persist {label} before testing for indexer {idx_id}: {e}")
+                        continue
+                    if _test_payload(run, saved, idx_id, label):
+                        logger.info(f"{label} works for {idx_name}; keeping the saved indexer")
+                        run.add_result('fixed', {'indexer': idx, 'new_base_url': candidate, 'tag': tag_obj})
+                        # clear any failure state for indexer
+                        run.clear_state(state_key)
+                        updated = True
+                        break
+            else:
+                logger.info(f"Testing original indexer with tag {TAG_TO_TRY} for {idx_name}")
+                payload = _test_plan(run, idx, idx_id, None, tag_obj, ui_fields)
+                if payload is not None:
+                    logger.info(f"Original indexer + tag {TAG_TO_TRY} works; saving indexer")
+                    if not DRY_RUN:
+                        client.update_indexer(idx_id, payload)
+                    run.add_result('fixed', {'indexer': idx, 'new_base_url': None, 'tag': tag_obj})
+                    # clear any failure state for indexer
+                    run.clear_state(state_key)
+                    updated = True
+        if not updated:
+            logger.info(f"No candidate base URL tested successfully for indexer {idx_name}")
+            # update indexer_state fail counters and cooldown
+            idx_state = run.get_state(state_key)
+            fail_count = idx_state.get('consecutive_failures', 0) + 1
+            if fail_count >= INDEXER_MAX_ATTEMPTS:
+                cooldown_until = now_ts + (INDEXER_COOLDOWN_MIN * 60)
+                idx_state['next_allowed_at'] = cooldown_until
+                idx_state['consecutive_failures'] = 0
+                logger.info(f"Indexer {idx_name} ({idx_id}) entering cooldown until {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(cooldown_until))} after {fail_count} failures")
+            else:
+                idx_state['consecutive_failures'] = fail_count
+                logger.debug("Indexer %s (%s) consecutive_failures set to %s", idx_name, idx_id, fail_count)
+            run.set_state(state_key, idx_state)
+            if persisted_changes and not DRY_RUN:
+                logger.info(f"Reverting indexer {idx_name} ({idx_id}) to its original configuration")
+                client.update_indexer(idx_id, original)
+            run.add_result('failed', idx)
+    except Exception as e:
+        logger.exception(f"Unexpected exception while processing indexer: {e}")
+        run.add_result('failed', idx)
+
+
+def run_once(client: Optional[ProwlarrClient] = None):
+    if client is None:
+        client = make_client()
+    if client is None:
+        logger.error('No Prowlarr client configured; run in DRY_RUN or set PROWLARR_URL/PROWLARR_API_KEY')
+        return {'fixed': [], 'skipped': [], 'failed': []}
+    try:
+        indexers, statuses, _ = client.bootstrap(include_tags=bool(TAG_TO_TRY) and not DRY_RUN)
+        status_map = {s['indexerId']: s for s in statuses if isinstance(s, dict) and 'indexerId' in s}
+    except Exception as e:
+        logger.exception(f'Failed to retrieve indexers list from Prowlarr: {e}')
+        return {'fixed': [], 'skipped': [], 'failed': []}
+    logger.info(f'Found {len(indexers)} indexers')
+    # Optional diagnostic: print per-indexer key sets and frequency summary
+    if INSPECT_INDEXERS:
+        key_counts = Counter()
+        indexer_keys = {}
+        for idx in indexers:
+            idx_id = idx.get('id') or idx.get('Id') or '<no-id>'
+            name = idx.get('name') or idx.get('Name') or '<no-name>'
+            keys = [k for k, v in idx.items() if v is not None]
+            indexer_keys[str(idx_id)] = {'name': name, 'keys': keys}
+            key_counts.update(keys)
+        logger.info('Indexer key frequency summary:')
+        for k, cnt in key_counts.most_common():
+            logger.info(f"  {k}: {cnt}/{len(indexers)}")
+        logger.info('Indexers and their keys (showing only keys with lower frequency):')
+        for idx_id, info in indexer_keys.items():
+            unique_keys = [k for k in info['keys'] if key_counts[k] < len(indexers)]
+            logger.info(f"  {info['name']} ({idx_id}): {unique_keys}")
+        # Show values for common definition fields to identify indexers that have 'no definition'
+        def_fields = ('definition', 'definitionId', 'definitionUid', 'definitionName', 'implementation', 'implementationName')
+        logger.info('Indexers missing definition-like values:')
+        for k in def_fields:
+            # treat falsy or empty strings/lists/dicts as missing
+            missing = [idx.get('name') or idx.get('Name') or idx.get('id') or '<no-name>'
+                       for idx in indexers if not (val := idx.get(k)) and val != 0]
+            if missing:
+                logger.info(f"  {k}: {len(missing)} indexers: {', '.join(missing)}")
+        # Exit early for inspection
+        # Optionally dump full JSON for specific indexers if requested
+        dump_names = frozenset(n.strip().lower() for n in DUMP_INDEXERS.split(',') if n.strip())
+        if dump_names:
+            for idx in indexers:
+                idx_name = (idx.get('name') or idx.get('Name') or str(idx.get('id'))).lower()
+                if idx_name in dump_names or str(idx.get('id')) in dump_names:
+                    try:
+                        logger.info(f"Dumping indexer {idx.get('name')} ({idx.get('id')}): {_json_dumps(idx, indent=True)[:10000]}")
+                    except Exception:
+                        logger.info(f"Dumping indexer {idx.get('name')} ({idx.get('id')}) (undumpable due to size or encoding)")
+        # Dump status objects for these names too to see if Prowlarr marked them as lacking definitions;
+        # the statuses fetched with the indexers above are reused rather than requested again
+        try:
+            if dump_names:
+                for idx in indexers:
+                    idx_id = idx.get('id')
+                    idx_name = (idx.get('name') or idx.get('Name') or str(idx_id)).lower()
+                    if idx_name in dump_names or str(idx_id) in dump_names:
+                        st = status_map.get(idx_id)
+                        if st:
+                            try:
+                                logger.info(f"Dumping indexer status for {idx.get('name')} ({idx_id}): {_json_dumps(st, indent=True)}")
+                            except Exception:
+                                logger.info(f"Dumping indexer status for {idx.get('name')} ({idx_id}) (undumpable)")
+        except Exception:
+            pass
+        return {'fixed': [], 'skipped': [], 'failed': []}
+    run = _RunContext(client, status_map, _load_indexer_state())
+    run.prune_state(frozenset(str(idx.get('id') or idx.get('Id')) for idx in indexers if isinstance(idx, dict)))
+    try:
+        # each indexer spends nearly all its time waiting on Prowlarr, so several are
+        # processed at once; pending state changes are flushed every _STATE_FLUSH_EVERY
+        with ThreadPoolExecutor(max_workers=INDEXER_WORKERS) as ex:
+            futures = [ex.submit(_process_indexer, run, idx) for idx in indexers]
+            for done, fut in enumerate(as_completed(futures), 1):
+                fut.result()
+                if done % _STATE_FLUSH_EVERY == 0:
+                    run.flush_state()
+    finally:
+        run.flush_state()
+    return run.results
+
+
+# set by SIGTERM/SIGINT; wakes run_loop from its sleep and stops new indexers being started
+_stop_event = threading.Event()
+
+
+def _request_stop(signum, frame) -> None:
+    logger.info(f"Received {signal.Signals(signum).name}; finishing in-flight indexers and exiting")
+    _stop_event.set()
+
+
+def run_loop():
+    client = make_client()
+    if client is None:
+        logger.error('No Prowlarr client configured; cannot run loop')
+        return
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    try:
+        while not _stop_event.is_set():
+            logger.info('Starting run cycle...')
+            res = run_once(client)
+            logger.info(f"Run complete: fixed={len(res['fixed'])} failed={len(res['failed'])} skipped={len(res['skipped'])}")
+            logger.debug(res)
+            if _stop_event.is_set():
+                break
+            logger.info(f"Sleeping {CHECK_INTERVAL_MIN} minutes...")
+            _stop_event.wait(CHECK_INTERVAL_MIN * 60)
+    finally:
+        client.close()
+    logger.info('Shutdown complete')
+
+
+def main():
+    if ONE_SHOT:
+        logger.info('ONE_SHOT enabled; running once and exiting')
+        result = run_once()
+        logger.info(f"Result: fixed={len(result['fixed'])} failed={len(result['failed'])} skipped={len(result['skipped'])}")
+    else:
+        run_loop()
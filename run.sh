@@ -3,7 +3,7 @@ set -euo pipefail
 
 # Run once or loop depending on environment variable
 if [ "${ONE_SHOT:-false}" = "true" ]; then
-  python /app/rotatarr.py
+  exec python /app/rotatarr.py
 else
-  python /app/rotatarr.py
+  exec python /app/rotatarr.py
 fi
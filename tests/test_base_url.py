@@ -0,0 +1,84 @@
+import pytest
+
+from rotatarr import core, set_base_url
+
+NEW = 'https://mirror.example.org/'
+
+
+def _settings():
+    return {'settings': {'BaseUrl': 'https://a.org/'}, 'fields': [{'name': 'baseUrl', 'value': 'https://f.org/'}]}
+
+
+def _config():
+    return {'config': {'url': 'https://a.org/'}, 'fields': [{'name': 'baseUrl', 'value': 'https://f.org/'}]}
+
+
+def _fields_by_name():
+    return {'fields': [{'name': 'apiPath', 'value': 'https://a.org/api'},
+                       {'name': 'BaseUrl', 'value': 'https://a.org/'}],
+            'indexerUrls': ['https://a.org/', 'https://b.org/'], 'BaseUrl': 'https://top.org/'}
+
+
+def _fields_first_http():
+    return {'fields': [{'name': 'limit', 'value': 100}, {'name': 'mirror', 'value': 'https://a.org/'},
+                       {'name': 'other', 'value': 'https://c.org/'}]}
+
+
+def _top_level():
+    return {'name': 'Example', 'BaseUrl': 'https://a.org/', 'indexerUrls': ['https://a.org/']}
+
+
+def test_settings_take_precedence():
+    idx = _settings()
+    set_base_url(idx, NEW)
+    assert idx['settings'] == {'BaseUrl': NEW}
+    assert idx['fields'][0]['value'] == 'https://f.org/'
+
+
+def test_settings_without_a_base_url_key_gets_baseUrl():
+    idx = {'settings': {}}
+    set_base_url(idx, NEW)
+    assert idx['settings'] == {'baseUrl': NEW}
+
+
+def test_config_key_is_replaced():
+    idx = _config()
+    set_base_url(idx, NEW)
+    assert idx['config'] == {'url': NEW}
+    assert idx['fields'][0]['value'] == 'https://f.org/'
+
+
+def test_fields_entry_named_baseurl_wins_over_earlier_url_fields():
+    idx = _fields_by_name()
+    set_base_url(idx, NEW)
+    assert [f['value'] for f in idx['fields']] == ['https://a.org/api', NEW]
+    # the URL lists and the top-level fallback are left alone
+    assert idx['indexerUrls'] == ['https://a.org/', 'https://b.org/']
+    assert idx['BaseUrl'] == 'https://top.org/'
+
+
+def test_first_url_field_is_used_without_a_baseurl_entry():
+    idx = _fields_first_http()
+    set_base_url(idx, NEW)
+    assert [f['value'] for f in idx['fields']] == [100, NEW, 'https://c.org/']
+
+
+def test_top_level_fallback():
+    idx = _top_level()
+    set_base_url(idx, NEW)
+    assert idx['BaseUrl'] == NEW
+    assert idx['indexerUrls'] == ['https://a.org/']
+
+
+@pytest.mark.parametrize('make, current', [
+    (_settings, 'https://a.org/'),
+    (_config, 'https://a.org/'),
+    (_fields_by_name, 'https://a.org/'),
+    (_fields_first_http, 'https://a.org/'),
+    (_top_level, 'https://a.org/'),
+])
+def test_current_base_url_reads_where_set_base_url_writes(make, current):
+    idx = make()
+    assert core._current_base_url(idx) == current
+    set_base_url(idx, NEW)
+    assert core._current_base_url(idx) == NEW
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from prowlarr_client import IndexerTestError
+from rotatarr import core
+
+
+class PersistStubClient:
+    """Rejects every test, answers saves with an empty body and can't read indexers back."""
+    def __init__(self):
+        self.updates = []
+        self._lock = threading.Lock()
+
+    def test_indexer(self, payload):
+        raise IndexerTestError('Test indexer failed: HTTP 400: nope', 400)
+
+    def update_indexer(self, idx_id, payload):
+        with self._lock:
+            self.updates.append(payload)
+        return None
+
+    def get_indexer(self, idx_id):
+        raise RuntimeError('read back failed')
+
+    def find_or_create_tag(self, label):
+        return {'id': 7, 'label': label}
+
+
+@pytest.fixture
+def persist_before_test(monkeypatch):
+    monkeypatch.setattr(core, 'TAG_TO_TRY', 'flaresolverr')
+    monkeypatch.setattr(core, 'TAG_FORCE', False)
+    monkeypatch.setattr(core, 'APPLY_TAG_SAVE_BEFORE_TEST', True)
+    monkeypatch.setattr(core, 'DRY_RUN', False)
+    monkeypatch.setattr(core, 'PREFILTER_CANDIDATES', False)
+
+
+def test_persisted_plan_is_reverted_when_reading_it_back_fails(persist_before_test):
+    client = PersistStubClient()
+    idx = {'id': 5, 'name': 'Example', 'capabilities': {},
+           'fields': [{'name': 'baseUrl', 'value': 'https://a.org/'}],
+           'indexerUrls': ['https://a.org/', 'https://b.org/'], 'tags': []}
+    run = core._RunContext(client, {5: {'mostRecentFailure': '2026-01-01T00:00:00Z'}}, {})
+
+    core._process_indexer(run, idx)
+
+    assert [r['name'] for r in run.results['failed']] == ['Example']
+    saved_urls = [u['fields'][0]['value'] for u in client.updates]
+    # as-is + tag, then b.org + tag, then the revert
+    assert saved_urls == ['https://a.org/', 'https://b.org/', 'https://a.org/']
+    assert 7 in client.updates[1]['tagIds']
+    revert = client.updates[-1]
+    assert revert['fields'][0]['value'] == 'https://a.org/'
+    assert not revert.get('tagIds') and revert['tags'] == []
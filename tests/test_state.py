@@ -0,0 +1,47 @@
+from rotatarr import core
+
+NOW = 1_800_000_000
+
+
+def _run(state):
+    run = core._RunContext(None, {}, state)
+    run.now_ts = NOW
+    return run
+
+
+def test_prune_state_drops_deleted_indexers():
+    run = _run({'1': {'consecutive_failures': 2}, '2': {'consecutive_failures': 1}})
+
+    run.prune_state(frozenset({'1'}))
+
+    assert run.indexer_state == {'1': {'consecutive_failures': 2}}
+    assert run.state_dirty
+
+
+def test_prune_state_drops_expired_cooldown_without_failures():
+    run = _run({'1': {'consecutive_failures': 0, 'next_allowed_at': NOW - 60}})
+
+    run.prune_state(frozenset({'1'}))
+
+    assert run.indexer_state == {}
+
+
+def test_prune_state_keeps_active_cooldown_and_failure_counts():
+    state = {'1': {'consecutive_failures': 0, 'next_allowed_at': NOW + 60},
+             '2': {'consecutive_failures': 1, 'next_allowed_at': NOW - 60}}
+    run = _run({k: dict(v) for k, v in state.items()})
+
+    run.prune_state(frozenset({'1', '2'}))
+
+    assert run.indexer_state == state
+    assert not run.state_dirty
+
+
+def test_prune_state_keeps_everything_without_live_ids():
+    state = {'1': {'consecutive_failures': 0, 'next_allowed_at': NOW + 60}}
+    run = _run(dict(state))
+
+    run.prune_state(frozenset())
+
+    assert run.indexer_state == state
+    assert not run.state_dirty
@@ -0,0 +1,106 @@
+import pytest
+
+from prowlarr_client import IndexerTestError
+from rotatarr import core
+
+
+class StubClient:
+    """Records every test payload; answers each with the next entry of outcomes
+    (an exception is raised, anything else returned)."""
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.tested = []
+
+    def test_indexer(self, payload):
+        self.tested.append(payload)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _indexer():
+    # 'capabilities' is not part of the UI-like payload, so a UI fallback is built
+    return {'id': 5, 'name': 'Example', 'capabilities': {'categories': []},
+            'fields': [{'name': 'baseUrl', 'value': 'https://example.org/'}], 'tags': []}
+
+
+def _run(client):
+    return core._RunContext(client, {}, {})
+
+
+def test_rejected_test_falls_back_to_ui_payload_and_returns_none():
+    client = StubClient(IndexerTestError('Test indexer failed: HTTP 400: nope', 400),
+                        IndexerTestError('Test indexer failed: HTTP 400: nope', 400))
+    idx = _indexer()
+
+    assert core._test_plan(_run(client), idx, 5, 'https://mirror.example.org/', None) is None
+
+    # a 4xx is not retried: one raw attempt, then one UI-like attempt
+    assert len(client.tested) == 2
+    raw, ui = client.tested
+    assert raw['fields'][0]['value'] == 'https://mirror.example.org/'
+    assert 'capabilities' in raw
+    assert 'capabilities' not in ui
+    assert ui['fields'][0]['value'] == 'https://mirror.example.org/'
+    # the source indexer is left untouched
+    assert idx['fields'][0]['value'] == 'https://example.org/'
+
+
+def test_ui_fallback_success_returns_full_payload():
+    client = StubClient(IndexerTestError('Test indexer failed: HTTP 400: nope', 400), {'isSuccess': True})
+
+    payload = core._test_plan(_run(client), _indexer(), 5, 'https://mirror.example.org/', None)
+
+    assert payload is client.tested[0]
+    assert 'capabilities' in payload
+
+
+def test_repeated_plan_is_answered_from_the_run_cache():
+    client = StubClient(IndexerTestError('Test indexer failed: HTTP 400: nope', 400),
+                        IndexerTestError('Test indexer failed: HTTP 400: nope', 400))
+    run = _run(client)
+    idx = _indexer()
+
+    assert core._test_plan(run, idx, 5, 'https://mirror.example.org/', None) is None
+    assert core._test_plan(run, idx, 5, 'https://mirror.example.org/', None) is None
+    assert len(client.tested) == 2
+
+
+def test_candidate_with_tag_falls_back_to_ui_payload_under_its_own_key():
+    client = StubClient(IndexerTestError('Test indexer failed: HTTP 400: nope', 400), {'isSuccess': True})
+    run = _run(client)
+    tag = {'id': 7, 'label': 'flaresolverr'}
+
+    payload = core._test_plan(run, _indexer(), 5, 'https://mirror.example.org/', tag)
+
+    # the tagged raw test was rejected, so the UI-like payload was tried and passed
+    raw, ui = client.tested
+    assert payload is raw
+    assert raw['tagIds'] == [7]
+    assert raw['fields'][0]['value'] == 'https://mirror.example.org/'
+    assert 'capabilities' not in ui
+    assert ui['fields'][0]['value'] == 'https://mirror.example.org/'
+    # the tagged raw outcome and the UI outcome are remembered under separate keys
+    assert (5, 'https://mirror.example.org/', 7, 'raw') in run.test_cache
+    assert [key[-1] for key in run.test_cache] == ['raw', 'ui']
+
+    # so the same plan again is answered from the cache, still via the UI fallback
+    assert core._test_plan(run, _indexer(), 5, 'https://mirror.example.org/', tag) is not None
+    assert len(client.tested) == 2
+
+
+def test_cache_hit_raises_a_fresh_error_with_the_same_outcome():
+    first = IndexerTestError('Test indexer failed: HTTP 400: nope', 400)
+    client = StubClient(first)
+    cache = {}
+
+    with pytest.raises(IndexerTestError) as raised:
+        core._cached_test(client, cache, 'key', {'id': 5}, 5, 'as-is')
+    assert raised.value is first
+    with pytest.raises(IndexerTestError) as hit:
+        core._cached_test(client, cache, 'key', {'id': 5}, 5, 'as-is')
+
+    assert hit.value is not first
+    assert (hit.value.status_code, str(hit.value)) == (400, str(first))
+    assert len(client.tested) == 1